@@ -2,11 +2,26 @@ import numpy as np
 import tkinter as tk
 import tkinter.ttk as ttk
 import tkinter.font as font
+import tkinter.filedialog as filedialog
+import tkinter.messagebox as messagebox
 import os
 import pathlib
 import platform
+import argparse
+import threading
+import multiprocessing
+import html
+import hashlib
+import re
+import csv
+import queue
+import tempfile
 
+from concurrent.futures import ProcessPoolExecutor
 from matplotlib.figure import Figure
+from matplotlib.cm import ScalarMappable
+from matplotlib.colors import Normalize, to_hex
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from matplotlib.backends.backend_tkagg import (
     FigureCanvasTkAgg,
     NavigationToolbar2Tk
@@ -15,6 +30,14 @@ from scipy.signal import savgol_filter, find_peaks
 from scipy.optimize import curve_fit
 from sys import exc_info
 
+DEFAULT_CV_NUM_ARR = [1, 2, 5, 10, 15, 20, 25, 30, 35, 45, 50]
+EXPORT_FORMATS = ('png', 'svg', 'pdf')
+COLOUR_CYCLE_LEN = 10 # matplotlib's default colour cycle repeats after this many lines
+MAP_CHUNK_PIXELS = 2048
+ONSET_KEYS = ('onset_anodic', 'onset_cathodic', 'e_pa', 'e_pc', 'e_half')
+ONSET_METHODS = ('threshold', 'tangent')
+AUTOSAVE_DELAY_MS = 1500
+
 class GraphFrame(ttk.Frame):
     def __init__(self, parent, *args, **kwargs):
         ttk.Frame.__init__(self, parent, *args, **kwargs)
@@ -23,9 +46,13 @@ class GraphFrame(ttk.Frame):
         self.ylabel = ''
         self.x = None
         self.y = None
-        self.cv_num_arr = [1, 2, 5, 10, 15, 20, 25, 30, 35, 45, 50]
+        self.cv_num_arr = list(DEFAULT_CV_NUM_ARR)
         self.graph_type = None
         self.filepath = None
+        self.colour_by_scan = None # None picks the colormap automatically once the colour cycle would repeat
+        self.onset = {}
+        self.loaded_save = None
+        self.existing_saves = set()
         self.parent = parent
         self.pack_propagate(0)
         
@@ -35,31 +62,60 @@ class GraphFrame(ttk.Frame):
         
         self.canvas.get_tk_widget().pack(side='left', expand=1, fill='both')
    
-    def update_view(self, tree_type, peaks=[]):
+    def update_view(self, tree_type, peaks=[], crop=True):
         self.figure.clear()
         self.axes = self.figure.add_subplot()
         self.graph_type = tree_type
-        if self.graph_type == 'nova':
-            for cv in self.cv_num_arr:
-                self.axes.plot(self.x[cv-1], self.y[cv-1], label=str(cv), picker=True, pickradius=1)
-                self.xlabel = 'Applied potential (V) vs. Ag'
-                self.ylabel = 'Current (mA)'
-        else:
-            mask_1200 = np.where(self.x<1200)
-            self.x = self.x[mask_1200]
-            self.y = self.y[mask_1200]
-            if self.y.max() > 0:
-                self.y = self.y/self.y.max()
-            self.axes.plot(self.x, self.y, picker=True, pickradius=1)
-            self.xlabel = 'Raman shift (cm-1)'
-            self.ylabel = 'Relative Intensity'
-        self.axes.set_xlabel(self.xlabel, fontsize=18)
-        self.axes.set_ylabel(self.ylabel, fontsize=18)
+        if self.graph_type == 'raman':
+            self.x, self.y = self.crop_raman(self.x, self.y, crop)
+        self.xlabel, self.ylabel = self.plot_axes(self.axes, self.x, self.y, self.graph_type, self.cv_num_arr, colour_by_scan=self.get_colour_by_scan())
         self.figure.tight_layout()
         self.canvas.draw_idle()
         self.parent.analysis_frame.update_view(self.cv_num_arr, tree_type, peaks)
+
+    @staticmethod
+    def crop_raman(x, y, crop=True):
+        # spectra lying wholly above 1200 cm-1 are left uncropped rather than emptied
+        mask_1200 = np.where(x<1200)
+        if crop and len(mask_1200[0]):
+            x = x[mask_1200]
+            y = y[mask_1200]
+        if y.max() > 0:
+            y = y/y.max()
+        return x, y
+
+    def get_colour_by_scan(self):
+        if self.colour_by_scan is None:
+            return len(self.cv_num_arr) > COLOUR_CYCLE_LEN
+        return self.colour_by_scan
+    
+    @staticmethod
+    def plot_axes(axes, x, y, graph_type, cv_num_arr, peaks=[], colour_by_scan=False):
+        # shared by the gui and the headless exporter so both draw graphs the same way
+        if graph_type == 'nova':
+            if colour_by_scan:
+                cmap_norm = Normalize(vmin=min(cv_num_arr), vmax=max(max(cv_num_arr), min(cv_num_arr)+1))
+                mappable = ScalarMappable(norm=cmap_norm, cmap='viridis')
+            for cv in cv_num_arr:
+                colour = mappable.to_rgba(cv) if colour_by_scan else None
+                axes.plot(x[cv-1], y[cv-1], label=str(cv), color=colour, picker=True, pickradius=1)
+            if colour_by_scan:
+                axes.figure.colorbar(mappable, ax=axes, label='Scan')
+            xlabel = 'Applied potential (V) vs. Ag'
+            ylabel = 'Current (mA)'
+        else:
+            axes.plot(x, y, picker=True, pickradius=1)
+            xlabel = 'Raman shift (cm-1)'
+            ylabel = 'Relative Intensity'
+        for peak in peaks:
+            if peak['peak_val'] not in ('', 'N/A'):
+                axes.axvline(float(peak['peak_val']), color='grey', linestyle='--', linewidth=1)
+        axes.set_xlabel(xlabel, fontsize=18)
+        axes.set_ylabel(ylabel, fontsize=18)
+        return xlabel, ylabel
         
-    def get_cv_num_str(self, cv_num_arr):
+    @staticmethod
+    def get_cv_num_str(cv_num_arr):
         cv_num_str = ''
         range_start_ind = -1
         count = 0
@@ -80,7 +136,8 @@ class GraphFrame(ttk.Frame):
             count+=1
         return cv_num_str
         
-    def get_cv_num_array(self, cv_num_str):
+    @staticmethod
+    def get_cv_num_array(cv_num_str):
         array = []
         split_str = cv_num_str.split(',')
         for string in split_str:
@@ -121,28 +178,16 @@ class NovaFrame(ttk.Frame):
         self.sub_btn_frame = tk.Frame(self.cont)
         self.submit_btn = Button(self.sub_btn_frame, text='Submit')
         self.submit_btn.configure(command=self.update_cvs)
+        self.colour_var = tk.BooleanVar(value=self.graph_frame.get_colour_by_scan())
+        self.colour_check = tk.Checkbutton(self.sub_btn_frame, text='Colour by scan', variable=self.colour_var, command=self.toggle_colour_mode)
         # Legend
         self.legend_cont = tk.Frame(self)
         self.legend_header = tk.Label(self.legend_cont, text='Legend')
-        self.legend_grid_cont = tk.Frame(self.legend_cont)
-        self.legend_grid_cont.rowconfigure(0, weight=1)
-        self.legend_grid_cont.columnconfigure(0, weight=1)
-        self.legend_canv = tk.Canvas(self.legend_grid_cont)
-        self.vert_scrollbar = ttk.Scrollbar(self.legend_grid_cont, orient='vertical', command=self.legend_canv.yview)
-        self.legend_canv.configure(yscrollcommand=self.vert_scrollbar.set)
-        self.scroll_frame = tk.Frame(self.legend_canv)
-        self.scroll_frame.bind('<Configure>', lambda e: self.legend_canv.configure(scrollregion=self.legend_canv.bbox('all')))
-        self.legend_canv.create_window((0,0), window=self.scroll_frame, anchor='nw', tags='scroll_frame')
-        self.legend_canv.bind('<Configure>', self.resize_scroll_frame)
+        self.legend = VirtualLegend(self.legend_cont)
        
-        legend = {'handles': [], 'labels': []}       
         axes = graph_frame.figure.axes[0]
-        legend['handles'],legend['labels'] = axes.get_legend_handles_labels()
-        index = 0
-        for handle in legend['handles']:
-            label = legend['labels'][index]
-            self.add_legend(handle, label)
-            index+=1
+        handles, labels = axes.get_legend_handles_labels()
+        self.legend.set_entries([(label, to_hex(handle.get_color())) for handle, label in zip(handles, labels)])
                     
         self.cont.pack(side='left', padx=(10,0), expand=1, fill='both')
         self.header_frame.pack(expand=1, fill='both')
@@ -151,26 +196,16 @@ class NovaFrame(ttk.Frame):
         self.cv_num_entry.grid(row=0, column=0)
         self.sub_btn_frame.pack(expand=1, fill='both')
         self.submit_btn.pack(side='top')
+        if len(cv_num_arr) > 1:
+            self.colour_check.pack(side='top')
         self.legend_header.pack(expand=1, fill='x')
-        self.legend_grid_cont.pack(expand=1, fill='both')
-        self.vert_scrollbar.grid(row=0, column=1, sticky='ns')
-        self.legend_canv.grid(row=0, column=0)
+        self.legend.pack(expand=1, fill='both')
         if len(cv_num_arr) > 1:
             self.legend_cont.pack(side='left', expand=1, fill='both')
     
-    def resize_scroll_frame(self, event):
-        self.legend_canv.itemconfig("scroll_frame", width=event.width)
-    
-    def add_legend(self, handle, label):
-        frame = tk.Frame(self.scroll_frame)
-        frame.columnconfigure(0, weight=1)
-        frame.columnconfigure(1, weight=1)
-        label = tk.Label(frame, text=label)
-        colour = tk.Label(frame, text='        ', bg=handle.get_color())
-                
-        frame.pack(fill='x', expand=1)
-        label.grid(row=0, column=0, pady=(0,5))
-        colour.grid(row=0, column=1, pady=(0,5), padx=(0,10))
+    def toggle_colour_mode(self):
+        self.graph_frame.colour_by_scan = self.colour_var.get()
+        self.graph_frame.update_view('nova')
         
     def update_cvs(self):
         old_cv_num_arr = self.graph_frame.cv_num_arr
@@ -179,12 +214,85 @@ class NovaFrame(ttk.Frame):
             self.submit_btn.config(activebackground=self.submit_btn.active_bg_col)
             self.graph_frame.cv_num_arr = self.graph_frame.get_cv_num_array(self.cv_num_str_var.get())
             self.graph_frame.update_view('nova')
+            self.parent.request_autosave()
         except Exception as e:
             self.submit_btn.config(bg='red', activebackground='darkred', text='Error')
             self.parent.save_frame.save_btn.config(state='disabled')
             print(e)
         
         
+class VirtualLegend(tk.Frame):
+    def __init__(self, parent, *args, **kwargs):
+        tk.Frame.__init__(self, parent, *args, **kwargs)
+        # only enough rows to fill the visible height are created, scrolling relabels them rather than making new widgets
+        self.entries = []
+        self.rows = []
+        self.first_row = 0
+        self.visible_rows = 1
+        self.row_height = font.nametofont('TkDefaultFont').metrics('linespace') + 9
+        
+        self.row_cont = tk.Frame(self)
+        self.vert_scrollbar = ttk.Scrollbar(self, orient='vertical', command=self.yview)
+        self.row_cont.bind('<Configure>', self.resize)
+        self.bind_scroll(self.row_cont)
+        
+        self.vert_scrollbar.pack(side='right', fill='y')
+        self.row_cont.pack(side='left', expand=1, fill='both')
+        
+    def bind_scroll(self, widget):
+        widget.bind('<MouseWheel>', lambda e: self.yview('scroll', -1 if e.delta > 0 else 1, 'units'))
+        widget.bind('<Button-4>', lambda e: self.yview('scroll', -1, 'units'))
+        widget.bind('<Button-5>', lambda e: self.yview('scroll', 1, 'units'))
+        
+    def set_entries(self, entries):
+        self.entries = entries
+        self.first_row = 0
+        self.refresh()
+        
+    def resize(self, event):
+        self.visible_rows = max(event.height // self.row_height, 1)
+        while len(self.rows) < self.visible_rows:
+            self.add_row()
+        self.refresh()
+        
+    def add_row(self):
+        frame = tk.Frame(self.row_cont)
+        frame.columnconfigure(0, weight=1)
+        frame.columnconfigure(1, weight=1)
+        label = tk.Label(frame)
+        colour = tk.Label(frame, text='        ')
+        label.grid(row=0, column=0, pady=(0,5))
+        colour.grid(row=0, column=1, pady=(0,5), padx=(0,10))
+        for widget in (frame, label, colour):
+            self.bind_scroll(widget)
+        self.rows.append((frame, label, colour))
+        
+    def yview(self, *args):
+        max_first_row = max(len(self.entries) - self.visible_rows, 0)
+        if args[0] == 'moveto':
+            self.first_row = int(round(float(args[1]) * len(self.entries)))
+        elif args[0] == 'scroll':
+            step = self.visible_rows if args[2] == 'pages' else 1
+            self.first_row += int(args[1]) * step
+        self.first_row = min(max(self.first_row, 0), max_first_row)
+        self.refresh()
+        
+    def refresh(self):
+        for count, (frame, label, colour) in enumerate(self.rows):
+            index = self.first_row + count
+            if count < self.visible_rows and index < len(self.entries):
+                text, colour_hex = self.entries[index]
+                label.config(text=text)
+                colour.config(bg=colour_hex)
+                frame.pack(fill='x', expand=1)
+            else:
+                frame.pack_forget()
+        if self.entries:
+            self.vert_scrollbar.set(self.first_row/len(self.entries), min((self.first_row+self.visible_rows)/len(self.entries), 1))
+        else:
+            self.vert_scrollbar.set(0, 1)
+        
+
 class AnalysisFrame(ttk.Frame):
     def __init__(self, parent, graph_frame, *args, **kwargs):
         ttk.Frame.__init__(self, parent, *args, **kwargs)
@@ -193,11 +301,15 @@ class AnalysisFrame(ttk.Frame):
         self.no_content = tk.Label(self, text='- Holding -')
         self.graph_frame = graph_frame
         self.peak_sel_frame = None
+        self.onset_frame = None
+        self.save_frame = None
         
         self.no_content.pack(fill='both', expand=True)
         
     def update_view(self, cv_num_arr, tree_type, peaks):
         self.clear()
+        self.peak_sel_frame = None
+        self.onset_frame = None
         if tree_type == 'raman':
             self.load_peak_analysis(peaks)
         else:
@@ -215,28 +327,124 @@ class AnalysisFrame(ttk.Frame):
     def load_nova_analysis(self, cv_num_arr):  
         self.nova_frame = NovaFrame(self, self.parent.graph_frame, cv_num_arr)
         self.nova_frame.pack(side='left', expand=1, fill='both')
+        self.onset_frame = OnsetFrame(self, self.graph_frame)
+        self.onset_frame.pack(side='left', expand=1, fill='both')
         
     def load_save_section(self):
         self.save_frame = SaveFrame(self, self.graph_frame)
         self.save_frame.pack(side='left', expand=1, fill='both')
+        
+    def request_autosave(self):
+        if self.save_frame:
+            self.save_frame.autosave()
             
     def clear(self):
         for child in self.winfo_children():
             child.destroy()
 
 
+class OnsetFrame(ttk.Frame):
+    def __init__(self, parent, graph_frame, *args, **kwargs):
+        ttk.Frame.__init__(self, parent, *args, **kwargs)
+        self.parent = parent
+        self.graph_frame = graph_frame
+        self.plot_window = None
+        onset = self.graph_frame.onset
+        
+        self.header = tk.Label(self, text='Onset / E1/2 (all scans)')
+        self.entry_frame = tk.Frame(self)
+        self.method_var = tk.StringVar(value=onset.get('method', 'threshold'))
+        self.threshold_var = tk.StringVar(value=str(onset.get('threshold', 0.0001)))
+        method_menu = tk.OptionMenu(self.entry_frame, self.method_var, *ONSET_METHODS)
+        threshold_label = tk.Label(self.entry_frame, text=' Threshold ')
+        threshold_entry = tk.Entry(self.entry_frame, textvariable=self.threshold_var, width=8)
+        self.detect_btn = Button(self, text='Detect')
+        self.detect_btn.configure(command=self.detect)
+        self.result_label = tk.Label(self, text='')
+        
+        self.header.pack()
+        self.entry_frame.pack()
+        method_menu.pack(side='left')
+        threshold_label.pack(side='left')
+        threshold_entry.pack(side='left')
+        self.detect_btn.pack()
+        self.result_label.pack()
+        if onset.get('result'):
+            self.show_summary(onset['result'])
+        
+    def detect(self):
+        try:
+            self.detect_btn.config(bg=self.detect_btn.btn_col, activebackground=self.detect_btn.active_bg_col)
+            threshold = float(self.threshold_var.get())
+            method = self.method_var.get()
+            result = detect_onsets(self.graph_frame.x, self.graph_frame.y, threshold, method)
+            self.graph_frame.onset = {'method': method, 'threshold': threshold, 'result': result}
+            self.show_summary(result)
+            self.show_plot(result)
+            self.parent.request_autosave()
+        except Exception as e:
+            self.detect_btn.config(bg='red', activebackground='darkred')
+            self.result_label.config(text='Error')
+            print(e)
+            
+    def show_summary(self, result):
+        found = int(np.isfinite(result['onset_anodic']).sum())
+        text = 'Anodic onset in {} of {} scans'.format(found, len(result['onset_anodic']))
+        if np.isfinite(result['e_half']).any():
+            text += '\nMean E1/2 {} V'.format(round(float(np.nanmean(result['e_half'])), 3))
+        self.result_label.config(text=text)
+        
+    def show_plot(self, result):
+        if self.plot_window is None or not self.plot_window.winfo_exists():
+            self.plot_window = tk.Toplevel(self.graph_frame.parent)
+            self.plot_window.title('Onset and half-wave potentials')
+            self.plot_window.figure = Figure(figsize=(6, 4), dpi=100)
+            self.plot_window.canvas = FigureCanvasTkAgg(self.plot_window.figure, self.plot_window)
+            self.plot_window.canvas.get_tk_widget().pack(expand=1, fill='both')
+        figure = self.plot_window.figure
+        figure.clear()
+        axes = figure.add_subplot()
+        scans = np.arange(1, len(result['e_half'])+1)
+        labels = {'onset_anodic': 'Anodic onset', 'onset_cathodic': 'Cathodic onset', 'e_half': 'E1/2'}
+        for key, label in labels.items():
+            axes.plot(scans, result[key], '.-', label=label)
+        axes.set_xlabel('Scan', fontsize=14)
+        axes.set_ylabel('Applied potential (V) vs. Ag', fontsize=14)
+        axes.legend(fontsize=8)
+        figure.tight_layout()
+        self.plot_window.canvas.draw_idle()
+
+
 class SaveFrame(ttk.Frame):
     def __init__(self, parent, graph_frame, *args, **kwargs):
         ttk.Frame.__init__(self, parent, *args, **kwargs)
         self.parent = parent
         self.graph_frame = graph_frame
+        self.autosaver = self.parent.parent.autosaver
         
         self.save_btn = Button(self, text='Save')
         self.save_btn.config(command=self.save)
         self.save_btn.pack()
         
     def save(self):
-        filepath = self.graph_frame.filepath
+        snapshot = self.get_snapshot(show_errors=True)
+        if snapshot:
+            self.autosaver.save_now(snapshot)
+            
+    def autosave(self):
+        # map pixels and malformed cv selections disable the save button, they should not be autosaved either
+        if self.save_btn['state'] == 'disabled':
+            return
+        snapshot = self.get_snapshot()
+        # autosave only ever writes, deleting an emptied save is left to the save button,
+        # and a save file that existed but was not the one opened is never overwritten
+        if snapshot and snapshot['lines'] is not None:
+            save_filepath = snapshot['filepath']
+            if save_filepath == self.graph_frame.loaded_save or save_filepath not in self.graph_frame.existing_saves:
+                self.autosaver.schedule(snapshot)
+                
+    @staticmethod
+    def get_save_filepath(filepath, graph_type, cv_num_arr):
         split_filepath = filepath.split('/')
         count = 0
         for x in split_filepath:
@@ -244,72 +452,276 @@ class SaveFrame(ttk.Frame):
                 split_filepath[count] = 'saved_data'
             count+=1
         save_filepath = '/'.join(split_filepath)
+        if graph_type == 'nova' and len(cv_num_arr) > 1:
+            split_filepath = save_filepath.split('.')
+            save_filepath = split_filepath[0] + '_CVs.' + split_filepath[-1]
+        return save_filepath
+        
+    def get_snapshot(self, show_errors=False):
+        # everything the background writer needs, read from the widgets now whilst they still exist
+        filepath = self.graph_frame.filepath
+        save_filepath = self.get_save_filepath(filepath, self.graph_frame.graph_type, self.graph_frame.cv_num_arr)
         save_check = 0
         if self.graph_frame.graph_type == 'nova':
             tree = self.parent.parent.saved_nova_tree
             if len(self.graph_frame.cv_num_arr) > 1:
-                split_filepath = save_filepath.split('.')
-                save_filepath = split_filepath[0] + '_CVs.' + split_filepath[-1]
                 save_check = 1
         else:
             tree = self.parent.parent.saved_ram_tree
+        peak_dicts = []
         if self.parent.peak_sel_frame:
             # loop through and check if any peak frames have peaks
-            peak_dicts = []
             for peak_frame in self.parent.peak_sel_frame.peak_frames:
                 if peak_frame.peak_dict['peak_val'] != 'N/A':
                     peak_dicts.append(peak_frame.peak_dict)
                     save_check = 1
+        if self.parent.onset_frame and self.graph_frame.onset.get('result'):
+            save_check = 1
+        snapshot = {'filepath': save_filepath, 'lines': None, 'tree': tree, 'button': self.save_btn}
         if save_check:
-            split_filepath = save_filepath.split('/')
-            dir_filepath = '/'.join(split_filepath[0:len(split_filepath)-1])
-            if not os.path.exists(dir_filepath):
-                os.makedirs(dir_filepath)
-            with open(save_filepath, 'w') as f:
-                f.truncate()
-                f.write('filepath;'+filepath+'\n')
-                if self.parent.peak_sel_frame:
-                    for x in peak_dicts:
-                        f.write('bound_1;'+str(x['bound_1'])+"\n")
-                        f.write('bound_2;'+str(x['bound_2'])+"\n")
-                        f.write('peak_val;'+str(x['peak_val'])+"\n")
-                if self.graph_frame.graph_type == 'nova':
-                    cv_num = self.graph_frame.cv_num_arr
-                    cv_num_str = self.graph_frame.get_cv_num_str(cv_num)
-                    f.write('cvNumberStr;'+cv_num_str+"\n")
-                self.save_btn.config(bg=self.save_btn.btn_col, activebackground=self.save_btn.active_bg_col)
-            tree.check_tree_items_in_sys()
-        else:
-            if os.path.isfile(save_filepath):
-                if self.parent.peak_sel_frame.peak_frames:
+            lines = ['filepath;'+filepath]
+            for x in peak_dicts:
+                lines.append('bound_1;'+str(x['bound_1']))
+                lines.append('bound_2;'+str(x['bound_2']))
+                lines.append('peak_val;'+str(x['peak_val']))
+                for key in ('peak_err', 'ci_low', 'ci_high'):
+                    if x.get(key, '') != '':
+                        lines.append(key+';'+str(x[key]))
+            if self.graph_frame.graph_type == 'nova':
+                cv_num = self.graph_frame.cv_num_arr
+                cv_num_str = self.graph_frame.get_cv_num_str(cv_num)
+                lines.append('cvNumberStr;'+cv_num_str)
+                if self.graph_frame.onset.get('result'):
+                    onset = self.graph_frame.onset
+                    lines.append('onset_method;'+onset['method'])
+                    lines.append('onset_threshold;'+str(onset['threshold']))
+                    for key in ONSET_KEYS:
+                        lines.append(key+';'+','.join(str(val) for val in onset['result'][key]))
+            snapshot['lines'] = lines
+            return snapshot
+        # nothing left to save, an existing save file is removed, the tree already knows whether it exists
+        if tree.find_tree_item(save_filepath) or self.autosaver.is_pending(save_filepath):
+            if self.parent.peak_sel_frame and self.parent.peak_sel_frame.peak_frames:
+                if show_errors:
                     self.save_btn.config(bg='red', activebackground='darkred')
-                else:    
-                    filepath_list, item_ids = tree.get_tree_item_lists()
-                    item_id = self.filepath_to_item_id(save_filepath, filepath_list, item_ids)
-                    tree.delete_tree_item(save_filepath, item_id, True)
-                    p = pathlib.Path(save_filepath)
-                    count = 0
-                    parent = (str(p.parents[count]).split('/'))[-1]
-                    while parent != 'raman' and parent != 'nova':
-                        parent_filepath = p.parents[count]
-                        if len(list(parent_filepath.iterdir())) == 0:
-                            item_id = self.filepath_to_item_id(str(parent_filepath), filepath_list, item_ids)
-                            tree.delete_tree_item(str(parent_filepath), item_id, True)
-                            count+=1
-                            parent = (str(p.parents[count]).split('/'))[-1]
-                        else:
-                            parent = 'raman'
-                    tree.check_tree_items_in_sys()
-            else:
-                self.save_btn.config(bg='red', activebackground='darkred')
-    
-    def filepath_to_item_id(self, filepath, filepath_list, item_ids):
+                return None
+            return snapshot
+        if show_errors:
+            self.save_btn.config(bg='red', activebackground='darkred')
+        return None
+                
+
+class AutoSaver:
+    def __init__(self, root, journal_dir, delay=AUTOSAVE_DELAY_MS):
+        # saves are debounced on the tk thread then written in order by a single worker thread,
+        # each pending save is journalled first so it can be replayed if the app dies before writing it
+        self.root = root
+        self.journal_dir = journal_dir
+        self.delay = delay
+        self.pending = {}
+        self.in_flight = {}
+        self.version = 0
+        self.journal_versions = {}
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+        self.worker = threading.Thread(target=self.run_jobs, daemon=True)
+        self.worker.start()
+        self.root.after(200, self.poll_results)
+        
+    def schedule(self, snapshot):
+        filepath = snapshot['filepath']
+        if filepath in self.pending:
+            self.root.after_cancel(self.pending[filepath][0])
+        self.version += 1
+        snapshot['version'] = self.version
+        self.jobs.put(('journal', snapshot))
+        after_id = self.root.after(self.delay, lambda: self.fire(filepath))
+        self.pending[filepath] = (after_id, snapshot)
+        
+    def save_now(self, snapshot):
+        filepath = snapshot['filepath']
+        if filepath in self.pending:
+            self.root.after_cancel(self.pending.pop(filepath)[0])
+        self.version += 1
+        snapshot['version'] = self.version
+        self.queue_save(snapshot)
+        
+    def fire(self, filepath):
+        after_id, snapshot = self.pending.pop(filepath)
+        self.queue_save(snapshot)
+        
+    def queue_save(self, snapshot):
+        filepath = snapshot['filepath']
+        self.in_flight[filepath] = self.in_flight.get(filepath, 0) + 1
+        self.jobs.put(('save', snapshot))
+        
+    def is_pending(self, filepath):
+        return filepath in self.pending or filepath in self.in_flight
+        
+    def flush(self):
+        for filepath in list(self.pending):
+            after_id, snapshot = self.pending.pop(filepath)
+            self.root.after_cancel(after_id)
+            self.queue_save(snapshot)
+        self.jobs.join()
+        
+    def run_jobs(self):
+        # worker thread, must never touch tk widgets, results are handed back through poll_results
+        while True:
+            job, snapshot = self.jobs.get()
+            filepath = snapshot['filepath']
+            try:
+                if job == 'journal':
+                    write_journal(self.get_journal_path(filepath), filepath, snapshot['lines'])
+                    self.journal_versions[filepath] = snapshot['version']
+                else:
+                    removed = []
+                    if snapshot['lines'] is None:
+                        removed = delete_save_file(filepath)
+                    else:
+                        atomic_write(filepath, '\n'.join(snapshot['lines'])+'\n')
+                    if self.journal_versions.get(filepath, -1) <= snapshot['version']:
+                        self.journal_versions.pop(filepath, None)
+                        journal_path = self.get_journal_path(filepath)
+                        if os.path.isfile(journal_path):
+                            os.remove(journal_path)
+                    self.results.put((snapshot, removed, ''))
+            except Exception as e:
+                if job == 'journal':
+                    print('{}, journal for {}'.format(e, filepath))
+                else:
+                    self.results.put((snapshot, [], str(e)))
+            finally:
+                self.jobs.task_done()
+                
+    def poll_results(self):
+        while not self.results.empty():
+            snapshot, removed, error = self.results.get()
+            self.apply_result(snapshot, removed, error)
+        self.root.after(200, self.poll_results)
+        
+    def apply_result(self, snapshot, removed, error):
+        filepath = snapshot['filepath']
+        self.in_flight[filepath] -= 1
+        if not self.in_flight[filepath]:
+            del self.in_flight[filepath]
+        tree = snapshot['tree']
+        button = snapshot['button']
+        button_exists = button.winfo_exists()
+        if error:
+            print('{}, file {}'.format(error, snapshot['filepath']))
+            if button_exists:
+                button.config(bg='red', activebackground='darkred')
+        elif snapshot['lines'] is None:
+            for filepath in removed:
+                tree.remove_tree_path(filepath)
+        else:
+            tree.add_tree_path(snapshot['filepath'])
+            if button_exists:
+                button.config(bg=button.btn_col, activebackground=button.active_bg_col)
+                
+    def get_journal_path(self, filepath):
+        return os.path.join(self.journal_dir, hashlib.md5(filepath.encode()).hexdigest() + '.txt')
+        
+    def recover(self):
+        # replays saves that were journalled but never written, call before the saved trees are populated
+        if not os.path.isdir(self.journal_dir):
+            return 0
         count = 0
-        for x in filepath_list:
-            if x == filepath:
-                return item_ids[count]
+        for journal_name in sorted(os.listdir(self.journal_dir)):
+            journal_path = os.path.join(self.journal_dir, journal_name)
+            # hidden .tmp files are atomic_write leftovers from a crash mid write, they were never committed
+            if journal_name.startswith('.'):
+                if journal_name.endswith('.tmp'):
+                    os.remove(journal_path)
+                continue
+            if not journal_name.endswith('.txt'):
+                continue
+            try:
+                filepath, lines = read_journal(journal_path)
+                if lines is None:
+                    delete_save_file(filepath)
+                else:
+                    atomic_write(filepath, '\n'.join(lines)+'\n')
+                os.remove(journal_path)
+                print('Recovered unsaved work for {}'.format(filepath))
+                count+=1
+            except Exception as e:
+                print('{}, file {}'.format(e, journal_path))
+        return count
+
+
+def atomic_write(filepath, text):
+    # written to a temporary file beside the target then renamed over it, so a crash never leaves half a save file
+    dir_filepath = os.path.dirname(filepath)
+    os.makedirs(dir_filepath, exist_ok=True)
+    fd, tmp_filepath = tempfile.mkstemp(dir=dir_filepath, prefix='.'+os.path.basename(filepath)+'.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_filepath, filepath)
+    except Exception:
+        if os.path.exists(tmp_filepath):
+            os.remove(tmp_filepath)
+        raise
+
+
+def delete_save_file(save_filepath):
+    # removes the save file then any parent folders it leaves empty, up to the raman or nova folder
+    removed = []
+    if os.path.isfile(save_filepath):
+        os.remove(save_filepath)
+        removed.append(save_filepath)
+    p = pathlib.Path(save_filepath)
+    count = 0
+    parent = p.parents[count].name
+    while parent != 'raman' and parent != 'nova':
+        parent_filepath = p.parents[count]
+        if parent_filepath.is_dir() and len(list(parent_filepath.iterdir())) == 0:
+            parent_filepath.rmdir()
+            removed.append(str(parent_filepath))
             count+=1
-                
+            parent = p.parents[count].name
+        else:
+            parent = 'raman'
+    return removed
+
+
+def write_journal(journal_path, filepath, lines):
+    action = 'delete' if lines is None else 'write'
+    atomic_write(journal_path, '\n'.join(['target;'+filepath, 'action;'+action] + (lines or []))+'\n')
+
+
+def read_journal(journal_path):
+    with open(journal_path, 'r', encoding='utf-8') as f:
+        journal_lines = f.read().splitlines()
+    filepath = journal_lines[0].split(';', 1)[1]
+    if journal_lines[1].split(';', 1)[1] == 'delete':
+        return filepath, None
+    return filepath, journal_lines[2:]
+    
+
+def run_in_background(widget, func, on_done, *args):
+    # tk is not thread safe, so func runs on a worker thread whilst the tk thread polls it,
+    # then on_done gets func's return value, or the exception it raised, back on the tk thread
+    result = []
+    def run():
+        try:
+            result.append(func(*args))
+        except Exception as e:
+            result.append(e)
+    def check():
+        if thread.is_alive():
+            widget.after(200, check)
+        else:
+            on_done(result[0])
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    widget.after(200, check)
+    return thread
+
 
 class PeakSelector(ttk.Frame):
     def __init__(self, parent, peak, peak_num, peak_select_frame, graph_frame,*args, **kwargs):
@@ -332,12 +744,12 @@ class PeakSelector(ttk.Frame):
             else:
                 bound_1 = tk.IntVar(value=round(x[bound_1_ind],2))
                 bound_2 = tk.IntVar(value=round(x[bound_2_ind],2))
-            peak_val = round(float(peak['peak_val']), 2)
+            peak_val = self.format_peak(peak['peak_val'], peak.get('peak_err', ''), peak.get('ci_low', ''), peak.get('ci_high', ''))
         else:
             bound_1 = tk.IntVar(value = '  -  ')
             bound_2 = tk.IntVar(value = '  -  ')
             peak_val = 'N/A'
-            self.peak_dict = {'peak_num': self.number, 'bound_1': -2, 'bound_2': -2, 'peak_val': 0}
+            self.peak_dict = {'peak_num': self.number, 'bound_1': -2, 'bound_2': -2, 'peak_val': 0, 'peak_err': '', 'ci_low': '', 'ci_high': ''}
             
         self.bound_1_val_label = tk.Label(self, textvariable=bound_1, name='bound_1', bg='white')
         self.bound_2_val_label = tk.Label(self, textvariable=bound_2, name='bound_2', bg='white')
@@ -362,6 +774,7 @@ class PeakSelector(ttk.Frame):
     def delete_peak_sel(self):
         self.destroy()
         del self.peak_select_frame.peak_frames[self.number]
+        self.peak_select_frame.parent.request_autosave()
         del self
         
     def check_graph_click(self, event, colour, bound_widget):
@@ -408,40 +821,147 @@ class PeakSelector(ttk.Frame):
                      # set save button to default colours
                      peak_inds = [bound_1_ind, bound_2_ind]
                      peak_inds.sort()
-                     peak = self.peak_fit(x, y, peak_inds, self.graph_frame.graph_type)
-                     self.peak_dict['peak_val'] = peak
-                     self.peak_val_label.config(text=round(peak,2), bg='lightblue')
+                     peak, peak_err, curve_params, sign = self.peak_fit(x, y, peak_inds, self.graph_frame.graph_type)
+                     ci_low = ci_high = ''
+                     if self.peak_select_frame.bootstrap_var.get():
+                         ci_low, ci_high = self.bootstrap_peak(x, y, peak_inds, self.graph_frame.graph_type, curve_params, sign)
+                     self.peak_dict.update({'peak_val': peak, 'peak_err': peak_err, 'ci_low': ci_low, 'ci_high': ci_high})
+                     self.peak_val_label.config(text=self.format_peak(peak, peak_err, ci_low, ci_high), bg='lightblue')
                  except Exception as e:
                      self.peak_val_label.config(bg='red', text='N/A')
-                     self.peak_dict['peak_val'] = 'N/A'
+                     self.peak_dict.update({'peak_val': 'N/A', 'peak_err': '', 'ci_low': '', 'ci_high': ''})
                      exc_type, exc_obj, tb = exc_info()
                      line_no = tb.tb_lineno
                      filename = tb.tb_frame.f_code.co_filename
                      print('{}, line {}, file {}'.format(e, line_no, filename))
+                 self.peak_select_frame.parent.request_autosave()
             
-    def lorentz_eqn(self, x, amp, width, centre):
+    @staticmethod
+    def lorentz_eqn(x, amp, width, centre):
 	    return amp*((width/2)/((x-centre)**2 + (width/2)**2))
 	
-    def gaussian_eqn(self, x, amp, width, centre):
+    @staticmethod
+    def gaussian_eqn(x, amp, width, centre):
 	    return amp*np.exp(-0.5*np.square((x-centre)/width))
     
+    @staticmethod
+    def lorentz_jac(x, amp, width, centre):
+        # partial derivatives of lorentz_eqn with respect to amp, width and centre
+        half_width = width/2
+        denom = (x-centre)**2 + half_width**2
+        d_amp = half_width/denom
+        d_width = amp*((x-centre)**2 - half_width**2)/(2*denom**2)
+        d_centre = amp*half_width*2*(x-centre)/denom**2
+        return np.stack([d_amp, d_width, d_centre], axis=-1)
+    
+    @staticmethod
+    def gaussian_jac(x, amp, width, centre):
+        # partial derivatives of gaussian_eqn with respect to amp, width and centre
+        u = (x-centre)/width
+        e = np.exp(-0.5*np.square(u))
+        return np.stack([e, amp*e*np.square(u)/width, amp*e*u/width], axis=-1)
+    
+    def get_fit_functions(self, graph_type):
+        if graph_type == 'raman':
+            return self.lorentz_eqn, self.lorentz_jac
+        return self.gaussian_eqn, self.gaussian_jac
+    
     def peak_fit(self, x, y, peak_inds, graph_type):
         x_data = x[peak_inds[0]:peak_inds[1]]
         y_data = y[peak_inds[0]:peak_inds[1]]
         width_guess = abs(x_data[0]-x_data[-1])
         centre_guess = (x_data[0]+x_data[-1])/2
         p0 = [1, width_guess, centre_guess]
-        if graph_type == 'raman':
-            function = self.lorentz_eqn
-        else:
-            function = self.gaussian_eqn
+        function = self.get_fit_functions(graph_type)[0]
+        sign = 1
         if y_data[0] >= max(y_data):
+            sign = -1
             y_data = y_data*-1
-        curve_params = curve_fit(function, x_data, y_data, p0=p0)[0]
+        curve_params, curve_cov = curve_fit(function, x_data, y_data, p0=p0)
         x_data = np.linspace(x_data[0], x_data[-1], 1000)
         ideal_y = function(x_data, curve_params[0], curve_params[1], curve_params[2])
         peak_ind = find_peaks(ideal_y)[0][0]
-        return x_data[peak_ind]
+        # both line shapes peak at their centre, so its standard error is that of the peak position
+        peak_err = float(np.sqrt(curve_cov[2][2]))
+        # the fitted parameters and sign flip are handed back so bootstrap_peak can start from this fit
+        return x_data[peak_ind], peak_err, curve_params, sign
+    
+    def bootstrap_peak(self, x, y, peak_inds, graph_type, curve_params, sign, n_boot=2000, jitter=2):
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        function, jacobian = self.get_fit_functions(graph_type)
+        x_data = x[peak_inds[0]:peak_inds[1]]
+        y_data = y[peak_inds[0]:peak_inds[1]]
+        residuals = y_data*sign - function(x_data, *curve_params)
+        # every replicate is fitted over the union of all jittered windows, with points outside its own window masked off
+        start = max(peak_inds[0]-jitter, 0)
+        stop = min(peak_inds[1]+jitter, len(x))
+        x_union = x[start:stop]
+        rng = np.random.default_rng()
+        y_boot = function(x_union, *curve_params) + rng.choice(residuals, size=(n_boot, len(x_union)))
+        lows = np.clip(peak_inds[0] + rng.integers(-jitter, jitter+1, n_boot), start, stop)
+        highs = np.clip(peak_inds[1] + rng.integers(-jitter, jitter+1, n_boot), start, stop)
+        too_short = (highs - lows) < 4
+        lows[too_short], highs[too_short] = peak_inds[0], peak_inds[1]
+        inds = np.arange(start, stop)
+        mask = (inds >= lows[:, None]) & (inds < highs[:, None])
+        params = self.batch_fit(function, jacobian, x_union, y_boot, mask, curve_params)
+        centres = params[:, 2]
+        centres = centres[np.isfinite(centres) & (centres >= x_union.min()) & (centres <= x_union.max())]
+        if len(centres) < n_boot/2:
+            raise Exception("Bootstrap failed, only {} of {} refits converged".format(len(centres), n_boot))
+        ci_low, ci_high = np.percentile(centres, [2.5, 97.5])
+        return float(ci_low), float(ci_high)
+    
+    @staticmethod
+    def batch_fit(function, jacobian, x, y, mask, p0, max_iter=100, tol=1e-10):
+        # levenberg-marquardt run on every bootstrap replicate at once rather than looping over curve_fit
+        n_fits = y.shape[0]
+        weights = mask.astype(float)
+        params = np.broadcast_to(np.asarray(p0, dtype=float), (n_fits, 3)).copy()
+        damping = np.full(n_fits, 1e-3)
+        
+        def get_cost(p):
+            resid = (y - function(x, p[:, 0:1], p[:, 1:2], p[:, 2:3]))*weights
+            return resid, np.einsum('ij,ij->i', resid, resid)
+        
+        resid, cost = get_cost(params)
+        active = np.ones(n_fits, dtype=bool)
+        for i in range(max_iter):
+            jac = jacobian(x, params[:, 0:1], params[:, 1:2], params[:, 2:3])*weights[:, :, None]
+            jtj = np.einsum('ijk,ijl->ikl', jac, jac)
+            jtr = np.einsum('ijk,ij->ik', jac, resid)
+            diag = np.einsum('ikk->ik', jtj)
+            lhs = jtj + damping[:, None, None]*(diag[:, :, None]*np.eye(3))
+            with np.errstate(all='ignore'):
+                step = np.einsum('ikl,il->ik', np.linalg.pinv(lhs), jtr)
+                new_params = params + step
+                new_resid, new_cost = get_cost(new_params)
+            better = active & np.isfinite(new_cost) & (new_cost < cost)
+            converged = better & ((cost - new_cost) <= tol*np.maximum(cost, 1e-300))
+            params[better] = new_params[better]
+            resid[better] = new_resid[better]
+            cost[better] = new_cost[better]
+            damping = np.where(better, damping/10, damping*10)
+            active &= ~converged & (damping < 1e12)
+            if not active.any():
+                break
+        return params
+    
+    @staticmethod
+    def format_peak(peak_val, peak_err='', ci_low='', ci_high=''):
+        if peak_val in ('', 'N/A'):
+            return 'N/A'
+        # the error is given to 2 significant figures and the other values to the same decimal place
+        decimals = 2
+        if peak_err != '' and np.isfinite(float(peak_err)) and float(peak_err) > 0:
+            decimals = max(1 - int(np.floor(np.log10(float(peak_err)))), 0)
+        text = '{:.{}f}'.format(float(peak_val), decimals)
+        if peak_err != '':
+            text += ' \u00b1 ' + '{:.{}f}'.format(float(peak_err), decimals)
+        if ci_low != '' and ci_high != '':
+            text += ' [' + '{:.{}f}'.format(float(ci_low), decimals) + ', ' + '{:.{}f}'.format(float(ci_high), decimals) + ']'
+        return text
         
             
 class PeakSelectFrame(ttk.Frame):
@@ -465,12 +985,15 @@ class PeakSelectFrame(ttk.Frame):
         self.new_peak_btn_cont = tk.Frame(self.scroll_frame)
         self.new_peak_btn = Button(self.new_peak_btn_cont, text='- New Peak -')
         self.new_peak_btn.configure(command=lambda peak=[]: self.add_peak(peak))
+        self.bootstrap_var = tk.BooleanVar(value=False)
+        self.bootstrap_check = tk.Checkbutton(self.new_peak_btn_cont, text='Bootstrap CI', variable=self.bootstrap_var)
         
         self.peak_header.grid(row=0, column=0)
         self.canvas.grid(row=0, column=0, sticky='nesw')
         self.vert_scrollbar.grid(row=0, column=1, sticky='ns')
         self.new_peak_btn_cont.pack(side='bottom')
         self.new_peak_btn.pack()
+        self.bootstrap_check.pack()
             
     def add_peak(self, peak):
         new_peak = PeakSelector(self.scroll_frame, peak, len(self.peak_frames), self, self.graph_frame)
@@ -508,6 +1031,8 @@ class TreeviewFrame(tk.Frame):
         self.canvas.bind('<Configure>', self.set_scroll_frame_dim)
         self.scroll_frame = ttk.Frame(self.canvas)
         self.tree = ttk.Treeview(self.scroll_frame)
+        self.header = header
+        self.export_thread = None
         self.tree.heading('#0', text=header, anchor='w')
         self.vert_scrollbar = ttk.Scrollbar(self.frame, orient='vertical', command=self.tree.yview)
         self.tree.configure(yscrollcommand=self.vert_scrollbar.set)
@@ -549,10 +1074,48 @@ class TreeviewFrame(tk.Frame):
             filepath = self.tree.item(item_id)['tags'][1]
             self.delete_menu.delete(0, 'end')
             self.delete_menu.add_command(label='Delete', command=lambda: self.delete_tree_item(filepath, item_id, True))
+            for fmt in EXPORT_FORMATS:
+                self.delete_menu.add_command(label='Export figures ('+fmt.upper()+')', command=lambda fmt=fmt: self.export_tree_item(filepath, fmt))
+            if self.tree_type == 'nova' and not self.save_tree and os.path.isfile(filepath):
+                self.delete_menu.add_command(label='Correlate with Raman', command=lambda: self.open_spec_elec(filepath))
             self.delete_menu.tk_popup(event.x_root, event.y_root)
             self.delete_menu.focus_set()
         self.refresh_menu.grab_release()
     
+    def export_tree_item(self, filepath, fmt='png'):
+        if os.path.isdir(filepath):
+            filepaths = collect_data_files(filepath)
+            root_path = filepath
+        else:
+            filepaths = [filepath]
+            root_path = os.path.dirname(filepath)
+        if self.export_thread and self.export_thread.is_alive():
+            return
+        # mirrors the data or saved_data path so raw and saved exports never overwrite each other
+        out_dir = os.getcwd() + '/exports/' + os.path.relpath(root_path, os.path.dirname(os.path.dirname(self.root_path)))
+        self.tree.heading('#0', text=self.header + ' - exporting {} figures...'.format(len(filepaths)))
+        # rendering happens in worker processes, this thread only stops the gui from freezing whilst waiting
+        index_path = os.path.join(out_dir, 'index.html')
+        self.export_thread = run_in_background(self, export_figures, lambda results: self.finish_export(results, index_path),
+                                               filepaths, self.tree_type, out_dir, root_path, fmt, self.save_tree)
+            
+    def finish_export(self, results, index_path):
+        self.tree.heading('#0', text=self.header)
+        if isinstance(results, Exception):
+            messagebox.showerror('Export failed', str(results), parent=self)
+            return
+        failed = len([result for result in results if result[3]])
+        message = 'Exported {} of {} figures.\nIndex: {}'.format(len(results)-failed, len(results), index_path)
+        if failed:
+            messagebox.showwarning('Export finished with errors', message, parent=self)
+        else:
+            messagebox.showinfo('Export finished', message, parent=self)
+    
+    def open_spec_elec(self, filepath):
+        raman_dir = filedialog.askdirectory(parent=self, title='Folder of Raman spectra', initialdir=self.parent.raman_tree.root_path)
+        if raman_dir:
+            SpecElecWindow(self.parent, filepath, raman_dir)
+    
     def set_scroll_frame_dim(self, event):
         self.canvas.update()
         self.canvas.itemconfigure('scrollable_frame', width=self.canvas.winfo_width(), height=self.canvas.winfo_height())
@@ -636,25 +1199,30 @@ class TreeviewFrame(tk.Frame):
     def open_graph(self, event):
         item_id = self.tree.selection()[0]
         filepath = self.tree.item(item_id)['tags'][1]
-        peaks = []
-        if self.save_tree:
-            filepath, cv_num_str, peaks = self.open_save(filepath)
-            if self.tree_type == 'nova':
-                self.parent.graph_frame.cv_num_arr = self.parent.graph_frame.get_cv_num_array(cv_num_str)
-        else:
-            self.parent.graph_frame.cv_num_arr = [1, 2, 5, 10, 15, 20, 25, 30, 35, 45, 50]            
-        x,y = self.process_file(filepath, self.tree_type)
-        y = savgol_filter(y, window_length=11, polyorder=3, mode="nearest")
+        if self.tree_type == 'raman' and not self.save_tree and is_map_file(filepath):
+            MapWindow(self.parent, filepath)
+            return
+        save_filepath = filepath if self.save_tree else None
+        filepath, x, y, cv_num_arr, peaks, onset = load_graph_data(filepath, self.tree_type, self.save_tree)
+        # autosave may only overwrite the save that was opened, or saves that did not exist yet
+        save_filepaths = {SaveFrame.get_save_filepath(filepath, self.tree_type, [1]), SaveFrame.get_save_filepath(filepath, self.tree_type, [1, 2])}
+        self.parent.graph_frame.loaded_save = save_filepath
+        self.parent.graph_frame.existing_saves = {path for path in save_filepaths if os.path.isfile(path)}
+        self.parent.graph_frame.cv_num_arr = cv_num_arr
+        self.parent.graph_frame.onset = onset
+        self.parent.graph_frame.colour_by_scan = None
         self.parent.graph_frame.x,self.parent.graph_frame.y = x,y
         self.parent.graph_frame.update_view(self.tree_type, peaks)
         self.parent.graph_frame.filepath = filepath
             
-    def open_save(self, filepath):
+    @staticmethod
+    def open_save(filepath):
         with open(filepath, 'r', encoding='utf-8') as f:
             lines= f.read().splitlines()
             peaks = []
             cv_num_str = ''
             og_filepath = ''
+            onset = {}
             count = 0
             for line in lines:
                 split_line = line.split(';')
@@ -667,11 +1235,20 @@ class TreeviewFrame(tk.Frame):
                 if split_line[0] == 'peak_val':
                     peaks[count]['peak_val'] = split_line[1]
                     count+=1
-                else:
+                elif split_line[0] in ('peak_err', 'ci_low', 'ci_high'):
+                    peaks[count-1][split_line[0]] = split_line[1]
+                elif split_line[0] == 'onset_method':
+                    onset['method'] = split_line[1]
+                elif split_line[0] == 'onset_threshold':
+                    onset['threshold'] = float(split_line[1])
+                elif split_line[0] in ONSET_KEYS:
+                    onset.setdefault('result', {})[split_line[0]] = np.array(split_line[1].split(','), dtype=float)
+                elif split_line[0] == 'cvNumberStr':
                     cv_num_str = split_line[1]
-        return og_filepath, cv_num_str, peaks
+        return og_filepath, cv_num_str, peaks, onset
              
-    def process_file(self, filepath, tree_type):
+    @staticmethod
+    def process_file(filepath, tree_type):
         with open(filepath, 'r', encoding="utf-8") as f:
             if tree_type == 'raman':
                 f.seek(len(f.readline()) + 1)
@@ -711,6 +1288,46 @@ class TreeviewFrame(tk.Frame):
                         y.append(current)
         return np.array(x),np.array(y)
     
+    def find_tree_item(self, filepath):
+        # follows the path down from the root rather than listing every item in the tree
+        rel_path = os.path.relpath(filepath, self.root_path)
+        if rel_path.startswith('..'):
+            return None
+        item_id = ''
+        abs_path = self.root_path
+        for part in pathlib.Path(rel_path).parts:
+            abs_path = os.path.join(abs_path, part)
+            for child in self.tree.get_children(item_id):
+                if self.tree.item(child)['tags'][1] == abs_path:
+                    item_id = child
+                    break
+            else:
+                return None
+        return item_id
+        
+    def add_tree_path(self, filepath):
+        rel_path = os.path.relpath(filepath, self.root_path)
+        parts = pathlib.Path(rel_path).parts
+        parent = ''
+        abs_path = self.root_path
+        count = 0
+        for part in parts:
+            abs_path = os.path.join(abs_path, part)
+            item_id = self.find_tree_item(abs_path)
+            if not item_id:
+                if count == len(parts)-1:
+                    filename = '.'.join(part.split('.')[0:-1])
+                    item_id = self.tree.insert(parent, 'end', text=filename, open=False, tags=('file', abs_path))
+                else:
+                    item_id = self.tree.insert(parent, 'end', text=part, open=False, tags=('folder', abs_path))
+            parent = item_id
+            count+=1
+            
+    def remove_tree_path(self, filepath):
+        item_id = self.find_tree_item(filepath)
+        if item_id:
+            self.delete_tree_item(filepath, item_id)
+    
     def get_all_children(self, item=''):
         children = self.tree.get_children(item)
         for child in children:
@@ -773,6 +1390,731 @@ class TreeviewFrame(tk.Frame):
                 filename = tb.tb_frame.f_code.co_filename
                 print('{}, line {}, file {}'.format(e, line_no, filename))
 
+
+def load_graph_data(filepath, tree_type, save_file=False):
+    peaks = []
+    onset = {}
+    cv_num_arr = list(DEFAULT_CV_NUM_ARR)
+    if save_file:
+        filepath, cv_num_str, peaks, onset = TreeviewFrame.open_save(filepath)
+        if tree_type == 'nova':
+            cv_num_arr = GraphFrame.get_cv_num_array(cv_num_str)
+    if tree_type == 'raman' and is_map_file(filepath):
+        # a map has no single spectrum, so stand in with its mean
+        waves, coords, cube_path = load_map_cube(filepath)
+        x,y = waves, map_mean_spectrum(cube_path)
+    else:
+        x,y = TreeviewFrame.process_file(filepath, tree_type)
+    y = savgol_filter(y, window_length=11, polyorder=3, mode="nearest")
+    return filepath, x, y, cv_num_arr, peaks, onset
+
+
+def collect_data_files(root_path):
+    filepaths = []
+    for dirpath, dirnames, filenames in os.walk(root_path):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.split('.')[-1] == 'txt':
+                filepaths.append(os.path.join(dirpath, filename))
+    return filepaths
+
+
+def infer_tree_type(path):
+    for part in reversed(pathlib.Path(os.path.abspath(path)).parts):
+        if part in ('raman', 'nova'):
+            return part
+    raise Exception("Could not infer whether {} holds raman or nova data, pass --type".format(path))
+
+
+def render_figure(filepath, tree_type, save_file, out_path, thumb_path, fmt):
+    # runs inside a worker process, so it only touches the non-interactive Agg canvas
+    try:
+        og_filepath, x, y, cv_num_arr, peaks, onset = load_graph_data(filepath, tree_type, save_file)
+        if tree_type == 'raman':
+            # maps are fitted over their whole range, so their mean spectrum is not cropped
+            x, y = GraphFrame.crop_raman(x, y, not is_map_file(og_filepath))
+        else:
+            cv_num_arr = [cv for cv in cv_num_arr if cv <= len(x)]
+        figure = Figure(figsize=(6, 4), dpi=100)
+        FigureCanvasAgg(figure)
+        axes = figure.add_subplot()
+        colour_by_scan = len(cv_num_arr) > COLOUR_CYCLE_LEN
+        GraphFrame.plot_axes(axes, x, y, tree_type, cv_num_arr, peaks, colour_by_scan)
+        if tree_type == 'nova' and 1 < len(cv_num_arr) and not colour_by_scan:
+            axes.legend(title='CV', fontsize=8, ncol=2)
+        axes.set_title(os.path.basename(og_filepath).split('.')[0], fontsize=10)
+        figure.tight_layout()
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+        figure.savefig(out_path, format=fmt)
+        figure.savefig(thumb_path, format='png', dpi=40)
+        return filepath, out_path, thumb_path, ''
+    except Exception as e:
+        return filepath, out_path, thumb_path, str(e)
+
+
+def write_contact_sheet(out_dir, results):
+    index_path = os.path.join(out_dir, 'index.html')
+    with open(index_path, 'w') as f:
+        f.write('<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>Figure export</title>\n')
+        f.write('<style>body{font-family:sans-serif} .sheet{display:flex;flex-wrap:wrap} '
+                '.cell{width:250px;margin:4px;text-align:center;font-size:12px;overflow-wrap:anywhere} '
+                '.cell img{width:240px} .error{color:darkred}</style></head><body>\n')
+        f.write('<h1>{} figures</h1>\n<div class="sheet">\n'.format(len(results)))
+        for filepath, out_path, thumb_path, error in results:
+            name = html.escape(os.path.basename(filepath).split('.')[0])
+            if error:
+                f.write('<div class="cell error">{}<br>{}</div>\n'.format(name, html.escape(error)))
+            else:
+                out_rel = html.escape(os.path.relpath(out_path, out_dir))
+                thumb_rel = html.escape(os.path.relpath(thumb_path, out_dir))
+                f.write('<div class="cell"><a href="{}"><img src="{}" loading="lazy"></a><br>{}</div>\n'.format(out_rel, thumb_rel, name))
+        f.write('</div>\n</body></html>\n')
+    return index_path
+
+
+def export_figures(filepaths, tree_type, out_dir, root_path, fmt='png', save_file=False, workers=None):
+    if fmt not in EXPORT_FORMATS:
+        raise Exception("Unsupported export format {}, use one of {}".format(fmt, ', '.join(EXPORT_FORMATS)))
+    jobs = []
+    for filepath in filepaths:
+        rel_path = os.path.relpath(filepath, root_path).rsplit('.', 1)[0]
+        out_path = os.path.join(out_dir, rel_path + '.' + fmt)
+        thumb_path = os.path.join(out_dir, 'thumbs', rel_path + '.png')
+        jobs.append((filepath, tree_type, save_file, out_path, thumb_path, fmt))
+    # spawn rather than fork, forking a process that owns a Tk interpreter is not safe
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        futures = [executor.submit(render_figure, *job) for job in jobs]
+        results = [future.result() for future in futures]
+    for filepath, out_path, thumb_path, error in results:
+        if error:
+            print('{}, file {}'.format(error, filepath))
+    index_path = write_contact_sheet(out_dir, results)
+    print('Exported {} figures, index at {}'.format(len(results), index_path))
+    return results
+
+
+def is_map_file(filepath):
+    # single spectra have a two column '#Wave #Intensity' header, maps either add '#X #Y' columns
+    # (one row per pixel and wavenumber) or start with a row of wavenumbers (one row per pixel)
+    with open(filepath, 'r', encoding='utf-8') as f:
+        fields = f.readline().split()
+    if fields and fields[0].startswith('#'):
+        return len(fields) >= 4
+    return len(fields) > 3
+
+
+def get_map_cache_paths(filepath, cache_dir=None):
+    if cache_dir is None:
+        cache_dir = os.getcwd() + '/map_cache'
+    name = pathlib.Path(filepath).stem + '_' + hashlib.md5(os.path.abspath(filepath).encode()).hexdigest()[:10]
+    return os.path.join(cache_dir, name + '.npy'), os.path.join(cache_dir, name + '_meta.npz')
+
+
+def load_map_cube(filepath, cache_dir=None):
+    # the cube is parsed once into a (pixels x wavenumbers) .npy file and memory mapped from then on
+    cube_path, meta_path = get_map_cache_paths(filepath, cache_dir)
+    if not (os.path.isfile(meta_path) and os.path.getmtime(meta_path) >= os.path.getmtime(filepath)):
+        os.makedirs(os.path.dirname(cube_path), exist_ok=True)
+        # the stale entry is removed first, so a failed parse never leaves a meta file pointing at a half written cube
+        for path in (meta_path, cube_path):
+            if os.path.isfile(path):
+                os.remove(path)
+        clean_map_cache(os.path.dirname(cube_path))
+        with open(filepath, 'r', encoding='utf-8') as f:
+            header = f.readline().split()
+        if header[0].startswith('#'):
+            waves, coords = parse_long_map(filepath, cube_path)
+        else:
+            waves, coords = parse_wide_map(filepath, cube_path)
+        np.savez(meta_path, waves=waves, coords=coords, source=os.path.abspath(filepath))
+    meta = np.load(meta_path)
+    return meta['waves'], meta['coords'], cube_path
+
+
+def clean_map_cache(cache_dir):
+    # drops cached cubes whose source map has been deleted or moved
+    removed = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith('_meta.npz'):
+            continue
+        meta_path = os.path.join(cache_dir, name)
+        try:
+            with np.load(meta_path) as meta:
+                source = str(meta['source']) if 'source' in meta.files else ''
+        except Exception:
+            source = ''
+        if not os.path.isfile(source):
+            cube_path = meta_path[:-len('_meta.npz')] + '.npy'
+            for path in (meta_path, cube_path):
+                if os.path.isfile(path):
+                    os.remove(path)
+                    removed.append(path)
+    return removed
+
+
+def parse_long_map(filepath, cube_path):
+    with open(filepath, 'r', encoding='utf-8') as f:
+        f.readline()
+        n_lines = 0
+        n_wave = 0
+        first_pixel = None
+        for line in f:
+            if not line.strip():
+                continue
+            pixel = line.split()[0:2]
+            if first_pixel is None:
+                first_pixel = pixel
+            if pixel == first_pixel:
+                n_wave += 1
+            n_lines += 1
+    n_pix = n_lines // n_wave
+    cube = np.lib.format.open_memmap(cube_path, mode='w+', dtype=np.float32, shape=(n_pix, n_wave))
+    coords = np.empty((n_pix, 2))
+    waves = None
+    with open(filepath, 'r', encoding='utf-8') as f:
+        f.readline()
+        pix_ind = 0
+        lines = []
+        for line in f:
+            if line.strip():
+                lines.append(line)
+            if len(lines) == MAP_CHUNK_PIXELS*n_wave:
+                waves = write_long_chunk(cube, coords, pix_ind, lines, n_wave)
+                pix_ind += len(lines)//n_wave
+                lines = []
+        if lines:
+            waves = write_long_chunk(cube, coords, pix_ind, lines, n_wave)
+    cube.flush()
+    del cube
+    return waves, coords
+
+
+def write_long_chunk(cube, coords, pix_ind, lines, n_wave):
+    vals = np.loadtxt(lines, ndmin=2).reshape(-1, n_wave, 4)
+    waves = vals[0, :, 2]
+    intensities = vals[:, :, 3]
+    if waves[0] > waves[-1]:
+        # stored in ascending wavenumber like process_file does for single spectra
+        waves = waves[::-1]
+        intensities = intensities[:, ::-1]
+    cube[pix_ind:pix_ind+len(vals)] = intensities
+    coords[pix_ind:pix_ind+len(vals)] = vals[:, 0, 0:2]
+    return waves
+
+
+def parse_wide_map(filepath, cube_path):
+    with open(filepath, 'r', encoding='utf-8') as f:
+        waves = np.array(f.readline().split(), dtype=float)
+        n_pix = sum(1 for line in f if line.strip())
+    cube = np.lib.format.open_memmap(cube_path, mode='w+', dtype=np.float32, shape=(n_pix, len(waves)))
+    coords = np.empty((n_pix, 2))
+    flip = waves[0] > waves[-1]
+    with open(filepath, 'r', encoding='utf-8') as f:
+        f.readline()
+        pix_ind = 0
+        lines = []
+        for line in f:
+            if line.strip():
+                lines.append(line)
+            if len(lines) == MAP_CHUNK_PIXELS:
+                write_wide_chunk(cube, coords, pix_ind, lines, flip)
+                pix_ind += len(lines)
+                lines = []
+        if lines:
+            write_wide_chunk(cube, coords, pix_ind, lines, flip)
+    cube.flush()
+    del cube
+    if flip:
+        waves = waves[::-1]
+    return waves, coords
+
+
+def write_wide_chunk(cube, coords, pix_ind, lines, flip):
+    vals = np.loadtxt(lines, ndmin=2)
+    intensities = vals[:, 2:]
+    if flip:
+        intensities = intensities[:, ::-1]
+    cube[pix_ind:pix_ind+len(vals)] = intensities
+    coords[pix_ind:pix_ind+len(vals)] = vals[:, 0:2]
+
+
+def map_mean_spectrum(cube_path):
+    cube = np.load(cube_path, mmap_mode='r')
+    total = np.zeros(cube.shape[1])
+    for start in range(0, cube.shape[0], MAP_CHUNK_PIXELS):
+        total += cube[start:start+MAP_CHUNK_PIXELS].sum(axis=0, dtype=float)
+    return total/cube.shape[0]
+
+
+def map_band_sum(cube_path, lo, hi):
+    cube = np.load(cube_path, mmap_mode='r')
+    sums = np.empty(cube.shape[0])
+    for start in range(0, cube.shape[0], MAP_CHUNK_PIXELS):
+        sums[start:start+MAP_CHUNK_PIXELS] = cube[start:start+MAP_CHUNK_PIXELS, lo:hi].sum(axis=1, dtype=float)
+    return sums
+
+
+def fit_map_chunk(cube_path, start, stop, lo, x):
+    # runs inside a worker process on a slice of pixels, x holds the band's wavenumbers starting at column lo
+    cube = np.load(cube_path, mmap_mode='r')
+    centre, height = fit_lorentz_band(x, np.asarray(cube[start:stop, lo:lo+len(x)], dtype=float))
+    return start, centre, height
+
+
+def fit_lorentz_band(x, y):
+    # fits every row of y at once, remove the linear background under the band first as the lorentzian has no offset term
+    baseline = y[:, :1] + (y[:, -1:] - y[:, :1])*((x - x[0])/(x[-1] - x[0]))
+    y = y - baseline
+    scale = y.max(axis=1)
+    scale[scale <= 0] = np.nan
+    y_norm = y/scale[:, None]
+    y_norm = np.nan_to_num(y_norm)
+    # the width guess is the number of points above half maximum, starting as wide as the window lets the fit collapse to zero
+    step = abs(x[-1]-x[0])/(len(x)-1)
+    width_guess = np.maximum((y_norm > 0.5).sum(axis=1), 1)*step
+    p0 = np.stack([width_guess/2, width_guess, x[np.argmax(y_norm, axis=1)]], axis=-1)
+    params = PeakSelector.batch_fit(PeakSelector.lorentz_eqn, PeakSelector.lorentz_jac, x, y_norm, np.ones(y_norm.shape, dtype=bool), p0)
+    centre = params[:, 2]
+    # the lorentzian is unchanged by flipping the sign of both amp and width, so only their ratio is checked
+    with np.errstate(all='ignore'):
+        height = 2*params[:, 0]/params[:, 1]*scale
+    bad = ~np.isfinite(height) | (centre < x.min()) | (centre > x.max()) | (height <= 0)
+    centre[bad] = np.nan
+    height[bad] = np.nan
+    return centre, height
+
+
+def fit_map(cube_path, waves, band, workers=None):
+    lo, hi = np.searchsorted(waves, sorted(band))
+    if hi - lo < 4:
+        raise Exception("Band {}-{} cm-1 holds fewer than 4 points".format(*sorted(band)))
+    n_pix = np.load(cube_path, mmap_mode='r').shape[0]
+    centres = np.full(n_pix, np.nan)
+    heights = np.full(n_pix, np.nan)
+    x = waves[lo:hi]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        futures = [executor.submit(fit_map_chunk, cube_path, start, min(start+MAP_CHUNK_PIXELS, n_pix), lo, x) for start in range(0, n_pix, MAP_CHUNK_PIXELS)]
+        for future in futures:
+            start, centre, height = future.result()
+            centres[start:start+len(centre)] = centre
+            heights[start:start+len(height)] = height
+    return centres, heights
+
+
+def map_to_grid(coords, values):
+    xs = np.unique(coords[:, 0])
+    ys = np.unique(coords[:, 1])
+    ix = np.searchsorted(xs, coords[:, 0])
+    iy = np.searchsorted(ys, coords[:, 1])
+    grid = np.full((len(ys), len(xs)), np.nan)
+    grid[iy, ix] = values
+    return xs, ys, grid
+
+
+class MapWindow(tk.Toplevel):
+    def __init__(self, main_app, filepath, *args, **kwargs):
+        tk.Toplevel.__init__(self, main_app, *args, **kwargs)
+        self.main_app = main_app
+        self.filepath = filepath
+        self.title('Raman map - ' + pathlib.Path(filepath).stem)
+        self.waves = self.coords = self.cube_path = self.cube = self.pixel_grid = None
+        self.map_axes = []
+        self.fit_thread = None
+        
+        self.controls = tk.Frame(self)
+        self.band_start_var = tk.StringVar()
+        self.band_end_var = tk.StringVar()
+        band_label = tk.Label(self.controls, text='Band (cm-1) ')
+        band_start_entry = tk.Entry(self.controls, textvariable=self.band_start_var, width=8)
+        band_end_entry = tk.Entry(self.controls, textvariable=self.band_end_var, width=8)
+        self.fit_btn = Button(self.controls, text='Fit map', state='disabled')
+        self.fit_btn.configure(command=self.start_fit)
+        self.status_label = tk.Label(self.controls, text='Loading map...')
+        
+        self.figure = Figure(figsize=(10, 4), dpi=100)
+        self.canvas = FigureCanvasTkAgg(self.figure, self)
+        self.canvas.mpl_connect('button_press_event', self.on_map_click)
+        
+        self.controls.pack(side='top', fill='x')
+        band_label.pack(side='left')
+        band_start_entry.pack(side='left')
+        band_end_entry.pack(side='left')
+        self.fit_btn.pack(side='left', padx=(5, 0))
+        self.status_label.pack(side='left', padx=(10, 0))
+        self.canvas.get_tk_widget().pack(side='top', expand=1, fill='both')
+        # parsing a large map and summing its cube can take minutes, so both happen off the tk thread
+        run_in_background(self, self.load_map, self.finish_load)
+        
+    def load_map(self):
+        waves, coords, cube_path = load_map_cube(self.filepath)
+        pixel_grid = map_to_grid(coords, np.arange(len(coords)))[2]
+        total = map_band_sum(cube_path, 0, len(waves))
+        return waves, coords, cube_path, pixel_grid, total
+            
+    def finish_load(self, result):
+        if isinstance(result, Exception):
+            self.status_label.config(text=str(result))
+            print(result)
+            return
+        self.waves, self.coords, self.cube_path, self.pixel_grid, total = result
+        self.cube = np.load(self.cube_path, mmap_mode='r')
+        self.band_start_var.set(str(round(self.waves[0], 1)))
+        self.band_end_var.set(str(round(self.waves[-1], 1)))
+        self.fit_btn.config(state='normal')
+        self.status_label.config(text='{} pixels, click one to view its spectrum'.format(len(self.coords)))
+        self.show_maps([('Total intensity', total, 'viridis')])
+        
+    def show_maps(self, maps):
+        self.figure.clear()
+        self.map_axes = []
+        for count, (title, values, cmap) in enumerate(maps):
+            axes = self.figure.add_subplot(1, len(maps), count+1)
+            self.map_axes.append(axes)
+            xs, ys, grid = map_to_grid(self.coords, values)
+            image = axes.imshow(grid, origin='lower', cmap=cmap, aspect='equal', interpolation='nearest', extent=self.get_extent(xs, ys))
+            self.figure.colorbar(image, ax=axes, label=title)
+            axes.set_xlabel('x (\u00b5m)')
+            axes.set_ylabel('y (\u00b5m)')
+        self.figure.tight_layout()
+        self.canvas.draw_idle()
+        
+    def get_extent(self, xs, ys):
+        step_x = (xs[-1]-xs[0])/(len(xs)-1) if len(xs) > 1 else 1
+        step_y = (ys[-1]-ys[0])/(len(ys)-1) if len(ys) > 1 else 1
+        return [xs[0]-step_x/2, xs[-1]+step_x/2, ys[0]-step_y/2, ys[-1]+step_y/2]
+        
+    def on_map_click(self, event):
+        # clicks on the colourbars land in axes too, only the heatmaps map to pixels
+        if self.coords is None or event.inaxes not in self.map_axes or event.xdata is None:
+            return
+        xs = np.unique(self.coords[:, 0])
+        ys = np.unique(self.coords[:, 1])
+        ix = np.abs(xs - event.xdata).argmin()
+        iy = np.abs(ys - event.ydata).argmin()
+        pixel = self.pixel_grid[iy, ix]
+        if np.isnan(pixel):
+            return
+        self.show_pixel(int(pixel))
+        
+    def show_pixel(self, pixel):
+        graph_frame = self.main_app.graph_frame
+        graph_frame.x = np.array(self.waves)
+        graph_frame.y = savgol_filter(np.asarray(self.cube[pixel], dtype=float), window_length=11, polyorder=3, mode="nearest")
+        graph_frame.filepath = self.filepath
+        # the fitted band can sit anywhere in the map's range, so the pixel is shown uncropped
+        graph_frame.update_view('raman', crop=False)
+        # pixels of a map have nowhere to be saved to
+        self.main_app.analysis_frame.save_frame.save_btn.config(state='disabled')
+        x, y = self.coords[pixel]
+        self.status_label.config(text='Pixel {} at ({}, {})'.format(pixel, x, y))
+        
+    def start_fit(self):
+        if self.fit_thread and self.fit_thread.is_alive():
+            return
+        try:
+            band = (float(self.band_start_var.get()), float(self.band_end_var.get()))
+        except ValueError:
+            self.fit_btn.config(bg='red', activebackground='darkred')
+            return
+        self.fit_btn.config(bg=self.fit_btn.btn_col, activebackground=self.fit_btn.active_bg_col, state='disabled')
+        self.status_label.config(text='Fitting {} pixels...'.format(len(self.coords)))
+        self.fit_thread = run_in_background(self, fit_map, self.finish_fit, self.cube_path, self.waves, band)
+            
+    def finish_fit(self, result):
+        self.fit_btn.config(state='normal')
+        if isinstance(result, Exception):
+            self.fit_btn.config(bg='red', activebackground='darkred')
+            self.status_label.config(text=str(result))
+            print(result)
+            return
+        centres, heights = result
+        self.show_maps([('Peak position (cm-1)', centres, 'coolwarm'), ('Peak intensity', heights, 'viridis')])
+        self.status_label.config(text='Fitted {} of {} pixels'.format(int(np.isfinite(centres).sum()), len(centres)))
+
+
+def read_nova_columns(filepath):
+    # whole columns at once rather than process_file's per scan lists, for joining against other time series
+    with open(filepath, 'r', encoding='utf-8') as f:
+        headers = f.readline().strip().split(';')
+    for header in ('Time (s)', 'Potential applied (V)'):
+        if header not in headers:
+            raise Exception("{} has no '{}' column".format(filepath, header))
+    usecols = [headers.index('Time (s)'), headers.index('Potential applied (V)')]
+    if 'Scan' in headers:
+        usecols.append(headers.index('Scan'))
+    vals = np.loadtxt(filepath, delimiter=';', skiprows=1, usecols=usecols, ndmin=2)
+    time, potential = vals[:, 0], vals[:, 1]
+    scan = vals[:, 2].astype(int) if vals.shape[1] == 3 else np.ones(len(time), dtype=int)
+    return time, potential, scan
+
+
+def parse_band_str(band_str):
+    bands = []
+    for string in band_str.split(','):
+        string = string.strip()
+        if string:
+            split_str = string.split('-')
+            if len(split_str) != 2:
+                raise Exception("Bands must be given as start-end, malformed band input")
+            bands.append(tuple(sorted((float(split_str[0]), float(split_str[1])))))
+    if not bands:
+        raise Exception("No bands given")
+    return bands
+
+
+def get_spectrum_times(filepaths, time_source='mtime'):
+    # 'mtime' uses when each file was written, 'name' reads seconds from the last number in each file name
+    if time_source == 'name':
+        times = []
+        for filepath in filepaths:
+            numbers = re.findall(r'\d+', pathlib.Path(filepath).stem)
+            if not numbers:
+                raise Exception("No time found in the file name of {}".format(filepath))
+            times.append(float(numbers[-1]))
+        return np.array(times)
+    times = np.array([os.path.getmtime(filepath) for filepath in filepaths])
+    return times - times.min()
+
+
+def read_raman_series(filepaths):
+    waves = None
+    spectra = None
+    for count, filepath in enumerate(filepaths):
+        vals = np.loadtxt(filepath, skiprows=1, ndmin=2)
+        order = np.argsort(vals[:, 0])
+        x, y = vals[order, 0], vals[order, 1]
+        if waves is None:
+            waves = x
+            spectra = np.empty((len(filepaths), len(waves)))
+        if len(x) != len(waves) or not np.allclose(x, waves):
+            y = np.interp(waves, x, y)
+        spectra[count] = y
+    return waves, spectra
+
+
+def correlate_series(nova_filepath, raman_filepaths, bands, offset=0, time_source='mtime'):
+    time, potential, scan = read_nova_columns(nova_filepath)
+    spec_times = get_spectrum_times(raman_filepaths, time_source) + offset
+    order = np.argsort(spec_times)
+    spec_times = spec_times[order]
+    raman_filepaths = [raman_filepaths[ind] for ind in order]
+    # the nova time column is sorted, so every spectrum is placed with one vectorised interpolation / binary search
+    spec_potential = np.interp(spec_times, time, potential, left=np.nan, right=np.nan)
+    scans, scan_starts = np.unique(scan, return_index=True)
+    scan_edges = np.append(time[np.sort(scan_starts)], time[-1])
+    spec_scan_pos = scans[0] + np.interp(spec_times, scan_edges, np.arange(len(scan_edges)), left=np.nan, right=np.nan)
+    spec_scan = np.floor(spec_scan_pos)
+    waves, spectra = read_raman_series(raman_filepaths)
+    result = {
+        'filepath': raman_filepaths,
+        'time': spec_times,
+        'potential': spec_potential,
+        'scan': spec_scan,
+        'scan_pos': spec_scan_pos,
+        'bands': bands
+    }
+    for lo_val, hi_val in bands:
+        lo, hi = np.searchsorted(waves, [lo_val, hi_val])
+        if hi - lo < 4:
+            raise Exception("Band {}-{} cm-1 holds fewer than 4 points".format(lo_val, hi_val))
+        centre, height = fit_lorentz_band(waves[lo:hi], spectra[:, lo:hi])
+        result[(lo_val, hi_val)] = (centre, height)
+    return result
+
+
+def write_series_csv(csv_path, result):
+    os.makedirs(os.path.dirname(csv_path), exist_ok=True)
+    header = ['filepath', 'time (s)', 'potential applied (V)', 'scan', 'scan position']
+    columns = [result['filepath'], result['time'], result['potential'], result['scan'], result['scan_pos']]
+    for band in result['bands']:
+        header += ['{}-{} position (cm-1)'.format(*band), '{}-{} intensity'.format(*band)]
+        columns += list(result[band])
+    with open(csv_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(zip(*columns))
+
+
+class SpecElecWindow(tk.Toplevel):
+    def __init__(self, main_app, nova_filepath, raman_dir, *args, **kwargs):
+        tk.Toplevel.__init__(self, main_app, *args, **kwargs)
+        self.main_app = main_app
+        self.nova_filepath = nova_filepath
+        self.raman_filepaths = collect_data_files(raman_dir)
+        self.title('Spectroelectrochemistry - ' + pathlib.Path(nova_filepath).stem)
+        self.fit_thread = None
+        self.result = None
+        
+        self.controls = tk.Frame(self)
+        self.band_var = tk.StringVar(value='1300-1400, 1550-1650')
+        self.offset_var = tk.StringVar(value='0')
+        self.time_source_var = tk.StringVar(value='mtime')
+        band_label = tk.Label(self.controls, text='Bands (cm-1) ')
+        band_entry = tk.Entry(self.controls, textvariable=self.band_var, width=24)
+        offset_label = tk.Label(self.controls, text=' Offset (s) ')
+        offset_entry = tk.Entry(self.controls, textvariable=self.offset_var, width=6)
+        time_source_label = tk.Label(self.controls, text=' Times from ')
+        time_source_menu = tk.OptionMenu(self.controls, self.time_source_var, 'mtime', 'name')
+        self.fit_btn = Button(self.controls, text='Fit')
+        self.fit_btn.configure(command=self.start_fit)
+        self.csv_btn = Button(self.controls, text='Export CSV', state='disabled')
+        self.csv_btn.configure(command=self.export_csv)
+        self.status_label = tk.Label(self.controls, text='{} spectra in {}'.format(len(self.raman_filepaths), raman_dir))
+        
+        self.figure = Figure(figsize=(10, 6), dpi=100)
+        self.canvas = FigureCanvasTkAgg(self.figure, self)
+        toolbar = NavigationToolbar2Tk(self.canvas, self)
+        
+        self.controls.pack(side='top', fill='x')
+        for widget in (band_label, band_entry, offset_label, offset_entry, time_source_label, time_source_menu):
+            widget.pack(side='left')
+        self.fit_btn.pack(side='left', padx=(5, 0))
+        self.csv_btn.pack(side='left', padx=(5, 0))
+        self.status_label.pack(side='left', padx=(10, 0))
+        self.canvas.get_tk_widget().pack(side='top', expand=1, fill='both')
+        
+    def start_fit(self):
+        if self.fit_thread and self.fit_thread.is_alive():
+            return
+        try:
+            bands = parse_band_str(self.band_var.get())
+            offset = float(self.offset_var.get())
+        except Exception as e:
+            self.fit_btn.config(bg='red', activebackground='darkred')
+            print(e)
+            return
+        self.fit_btn.config(bg=self.fit_btn.btn_col, activebackground=self.fit_btn.active_bg_col, state='disabled')
+        self.status_label.config(text='Fitting {} spectra...'.format(len(self.raman_filepaths)))
+        self.fit_thread = run_in_background(self, correlate_series, self.finish_fit, self.nova_filepath, self.raman_filepaths,
+                                            bands, offset, self.time_source_var.get())
+            
+    def finish_fit(self, result):
+        self.fit_btn.config(state='normal')
+        if isinstance(result, Exception):
+            self.fit_btn.config(bg='red', activebackground='darkred')
+            self.status_label.config(text=str(result))
+            print(result)
+            self.result = None
+            return
+        self.result = result
+        self.csv_btn.config(state='normal')
+        matched = int(np.isfinite(self.result['potential']).sum())
+        self.status_label.config(text='{} of {} spectra fall within the CV'.format(matched, len(self.result['time'])))
+        self.show_result()
+        
+    def show_result(self):
+        self.figure.clear()
+        result = self.result
+        scan_norm = Normalize(vmin=np.nanmin(result['scan']), vmax=max(np.nanmax(result['scan']), np.nanmin(result['scan'])+1))
+        axes = self.figure.subplots(2, 2, sharex='col')
+        for band in result['bands']:
+            centre, height = result[band]
+            label = '{}-{}'.format(*band)
+            axes[0][0].scatter(result['potential'], centre, c=result['scan'], cmap='viridis', norm=scan_norm, s=8, label=label)
+            axes[1][0].scatter(result['potential'], height, c=result['scan'], cmap='viridis', norm=scan_norm, s=8)
+            axes[0][1].plot(result['scan_pos'], centre, '.', markersize=3, label=label)
+            axes[1][1].plot(result['scan_pos'], height, '.', markersize=3)
+        axes[0][0].set_ylabel('Band position (cm-1)')
+        axes[1][0].set_ylabel('Band intensity')
+        axes[1][0].set_xlabel('Applied potential (V) vs. Ag')
+        axes[1][1].set_xlabel('Scan')
+        axes[0][1].legend(title='Band', fontsize=8)
+        self.figure.colorbar(ScalarMappable(norm=scan_norm, cmap='viridis'), ax=axes[:, 0].tolist(), label='Scan')
+        self.canvas.draw_idle()
+        
+    def export_csv(self):
+        csv_path = os.getcwd() + '/exports/' + pathlib.Path(self.nova_filepath).stem + '_raman_bands.csv'
+        write_series_csv(csv_path, self.result)
+        self.status_label.config(text='Saved ' + csv_path)
+
+
+def detect_onsets(x, y, threshold, method='threshold', baseline_frac=0.1):
+    # x and y are the scan indexed (scans x points) arrays from process_file, every scan is handled at once
+    x = np.atleast_2d(np.asarray(x, dtype=float))
+    y = np.atleast_2d(np.asarray(y, dtype=float))
+    if method not in ONSET_METHODS:
+        raise Exception("Unknown onset method {}".format(method))
+    rows = np.arange(len(x))
+    sweep = np.sign(np.gradient(x, axis=1))
+    result = {}
+    for branch, direction in (('anodic', 1), ('cathodic', -1)):
+        mask = sweep == direction
+        has_branch = mask.any(axis=1)
+        # the cathodic current is flipped so both branches look for a rising current
+        current = y*direction
+        peak_ind = np.argmax(np.where(mask, current, -np.inf), axis=1)
+        peak_pot = np.where(has_branch, x[rows, peak_ind], np.nan)
+        if method == 'threshold':
+            onset = threshold_crossing(x, current, mask, threshold)
+        else:
+            # the potential is flipped too so the current rises along increasing x on both branches
+            onset = tangent_onset(x*direction, current, mask, peak_ind, baseline_frac)*direction
+        result['onset_'+branch] = onset
+        result['e_p'+branch[0]] = peak_pot
+    result['e_half'] = (result['e_pa'] + result['e_pc'])/2
+    return result
+
+
+def threshold_crossing(x, current, mask, threshold):
+    rows = np.arange(len(x))
+    above = current >= threshold
+    crossing = mask[:, :-1] & mask[:, 1:] & ~above[:, :-1] & above[:, 1:]
+    ind = np.argmax(crossing, axis=1)
+    pot_0, pot_1 = x[rows, ind], x[rows, ind+1]
+    current_0, current_1 = current[rows, ind], current[rows, ind+1]
+    with np.errstate(all='ignore'):
+        onset = pot_0 + (threshold - current_0)*(pot_1 - pot_0)/(current_1 - current_0)
+    onset[~crossing.any(axis=1)] = np.nan
+    return onset
+
+
+def tangent_onset(x, current, mask, peak_ind, baseline_frac):
+    # intersection of the baseline, fitted to the start of the branch, with the tangent at the steepest point before the peak
+    rows = np.arange(len(x))
+    rank = np.cumsum(mask, axis=1)
+    with np.errstate(all='ignore'):
+        slope = np.gradient(current, axis=1)/np.gradient(x, axis=1)
+    before_peak = mask & (rank <= rank[rows, peak_ind][:, None])
+    steep_ind = np.argmax(np.where(before_peak & np.isfinite(slope), slope, -np.inf), axis=1)
+    tangent_slope = slope[rows, steep_ind]
+    n_base = np.maximum(np.ceil(mask.sum(axis=1)*baseline_frac), 2)
+    base = mask & (rank <= n_base[:, None])
+    n = base.sum(axis=1)
+    sum_x = np.where(base, x, 0).sum(axis=1)
+    sum_y = np.where(base, current, 0).sum(axis=1)
+    sum_xx = np.where(base, x*x, 0).sum(axis=1)
+    sum_xy = np.where(base, x*current, 0).sum(axis=1)
+    with np.errstate(all='ignore'):
+        base_slope = (n*sum_xy - sum_x*sum_y)/(n*sum_xx - sum_x**2)
+        base_intercept = (sum_y - base_slope*sum_x)/n
+        onset = (current[rows, steep_ind] - tangent_slope*x[rows, steep_ind] - base_intercept)/(base_slope - tangent_slope)
+    onset[~np.isfinite(onset) | (tangent_slope <= 0)] = np.nan
+    return onset
+
+
+def write_onsets_csv(csv_path, results):
+    os.makedirs(os.path.dirname(csv_path), exist_ok=True)
+    with open(csv_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['filepath', 'scan'] + list(ONSET_KEYS))
+        for filepath, result in results:
+            for count in range(len(result['e_half'])):
+                writer.writerow([filepath, count+1] + [result[key][count] for key in ONSET_KEYS])
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='NOVA CV and Raman viewer')
+    parser.add_argument('--export', metavar='PATH', help='render every .txt file under PATH (a file or folder) to figures without opening the gui')
+    parser.add_argument('--type', choices=['raman', 'nova'], help='data type of PATH, inferred from the folder names if not given')
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='png')
+    parser.add_argument('--out', default=os.getcwd() + '/exports', help='output folder for figures and index.html')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes, defaults to the cpu count')
+    parser.add_argument('--onsets', metavar='PATH', help='detect onset and half-wave potentials for every scan of every nova file under PATH and write them to a csv')
+    parser.add_argument('--threshold', type=float, default=0.0001, help='onset current threshold, in the units of the nova current column')
+    parser.add_argument('--method', choices=ONSET_METHODS, default='threshold', help='onset from a current threshold or from a tangent intersection')
+    return parser.parse_args()
+
             
 class MainApp(tk.Frame):
     def __init__(self, parent, *args, **kwargs):
@@ -789,6 +2131,8 @@ class MainApp(tk.Frame):
         self.rowconfigure(2, weight=1)
         self.rowconfigure(3, weight=1)
         
+        self.autosaver = AutoSaver(self, os.getcwd() + '/.autosave_journal')
+        self.autosaver.recover()
         self.graph_frame = GraphFrame(self, name='graph_frame')
         self.analysis_frame = AnalysisFrame(self, self.graph_frame)
         raman_datapath = os.getcwd() + '/data/raman'
@@ -807,8 +2151,35 @@ class MainApp(tk.Frame):
         self.nova_tree.grid(column=0, row=0, rowspan=2, sticky='nesw')
         self.saved_ram_tree.grid(column=1,row=2,rowspan=2,sticky='nesw')
         self.saved_nova_tree.grid(column=0, row=2, rowspan=2, sticky='nesw')
+        self.parent.protocol('WM_DELETE_WINDOW', self.close)
+        
+    def close(self):
+        self.autosaver.flush()
+        self.parent.destroy()
         
 if __name__ == '__main__':
+    args = parse_args()
+    if args.export:
+        tree_type = args.type or infer_tree_type(args.export)
+        save_file = 'saved_data' in pathlib.Path(os.path.abspath(args.export)).parts
+        if os.path.isdir(args.export):
+            filepaths = collect_data_files(args.export)
+            root_path = args.export
+        else:
+            filepaths = [args.export]
+            root_path = os.path.dirname(args.export)
+        export_figures(filepaths, tree_type, args.out, root_path, args.format, save_file, args.workers)
+        raise SystemExit
+    if args.onsets:
+        filepaths = collect_data_files(args.onsets) if os.path.isdir(args.onsets) else [args.onsets]
+        results = []
+        for filepath in filepaths:
+            x, y = load_graph_data(filepath, 'nova')[1:3]
+            results.append((filepath, detect_onsets(x, y, args.threshold, args.method)))
+        csv_path = os.path.join(args.out, 'onsets.csv')
+        write_onsets_csv(csv_path, results)
+        print('Detected onsets for {} files, written to {}'.format(len(results), csv_path))
+        raise SystemExit
     root = tk.Tk()
     if platform.system == 'Windows':
         root.state('zoomed')